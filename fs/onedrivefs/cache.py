@@ -0,0 +1,49 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+class TTLCache:
+	# Small thread-safe LRU cache whose entries expire after ttl seconds
+	def __init__(self, maxsize, ttl):
+		self.maxsize = maxsize
+		self.ttl = ttl
+		self._entries = OrderedDict()
+		self._lock = Lock()
+
+	def get(self, key, default=None):
+		# expired entries are kept until they're evicted so that they can still be revalidated with get_stale
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is None:
+				return default
+			expiry, value = entry
+			if expiry < monotonic():
+				return default
+			self._entries.move_to_end(key)
+			return value
+
+	def get_stale(self, key, default=None):
+		with self._lock:
+			entry = self._entries.get(key)
+			return default if entry is None else entry[1]
+
+	def __setitem__(self, key, value):
+		with self._lock:
+			self._entries[key] = (monotonic() + self.ttl, value)
+			self._entries.move_to_end(key)
+			while len(self._entries) > self.maxsize:
+				self._entries.popitem(last=False)
+
+	def pop(self, key, default=None):
+		with self._lock:
+			entry = self._entries.pop(key, None)
+			return default if entry is None else entry[1]
+
+	def discard_if(self, predicate):
+		with self._lock:
+			for key in [key for key in self._entries if predicate(key)]:
+				del self._entries[key]
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
@@ -1,38 +1,178 @@
+from calendar import timegm
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from functools import lru_cache
 from io import BytesIO
+from itertools import islice
 from logging import getLogger
+from re import compile as re_compile, escape as re_escape
+from threading import Lock
+from time import perf_counter, sleep, time
 from urllib.parse import urlencode
 
 from fs.base import FS
 from fs.enums import ResourceType
-from fs.errors import DestinationExists, DirectoryExists, DirectoryExpected, DirectoryNotEmpty, FileExists, FileExpected, ResourceNotFound
+from fs.errors import DestinationExists, DirectoryExists, DirectoryExpected, DirectoryNotEmpty, FileExists, FileExpected, InvalidCharsInPath, ResourceNotFound
 from fs.info import Info
 from fs.mode import Mode
-from fs.path import basename, dirname
+from fs.path import abspath, basename, dirname, join, normpath
 from fs.subfs import SubFS
-from fs.time import datetime_to_epoch, epoch_to_datetime
-from requests import codes, get, Session
+from requests import codes, get, HTTPError, Session
+from requests.adapters import HTTPAdapter
+from requests.utils import requote_uri
 from requests_oauthlib import OAuth2Session
+from urllib3.util import Retry
 
-from .throttling import throttle
+try:
+	from orjson import loads # faster than the standard library when it's installed
+except ImportError:
+	from json import loads
+
+from .cache import TTLCache
+from .throttling import retry_after_delay, retry_on_conflict, throttle, ThrottleDeadline
 
 _log = getLogger(__name__)
 
 SIMPLE_UPLOAD_LIMIT = 250e6
 
+# Resumable upload fragments must be a multiple of 320 KiB and less than 60 MiB
+# https://learn.microsoft.com/en-us/graph/api/driveitem-createuploadsession#upload-bytes-to-the-upload-session
+_UPLOAD_FRAGMENT_UNIT = 320 * 1024
+_MAX_UPLOAD_CHUNK_SIZE = 191 * _UPLOAD_FRAGMENT_UNIT
+DEFAULT_UPLOAD_CHUNK_SIZE = 32 * _UPLOAD_FRAGMENT_UNIT # 10 MiB
+
+# Fragments that upload faster than this are doubled in size, slower ones are halved
+_FAST_FRAGMENT_SECONDS = 2
+_SLOW_FRAGMENT_SECONDS = 10
+
+_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# https://learn.microsoft.com/en-us/graph/json-batching
+_BATCH_LIMIT = 20
+
+# Server errors and dropped connections are retried by urllib3
+# Only the idempotent methods are retried - a PATCH (e.g. a move) or POST that succeeded despite the error would fail when repeated
+# urllib3 would otherwise also retry a 429 with a Retry-After header itself, but throttling has to go through throttle() so that the session's other requests wait too
+_RETRY = Retry(total=5, backoff_factor=1, status_forcelist=(500, 502, 503, 504), raise_on_status=False, respect_retry_after_header=False)
+
+# Shared by all the sessions that we create so that OneDriveFS instances reuse each other's connections
+# Keep enough connections alive for the Graph, upload and download hosts to be reused across threads
+_SHARED_ADAPTER = HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=_RETRY)
+
+# Access tokens are refreshed this many seconds before they expire
+_TOKEN_REFRESH_MARGIN = 300
+
+# Upper bound in seconds between polls of the status of a copy
+_COPY_POLL_MAX_INTERVAL = 30
+
+_INVALID_PATH_CHARS = ':\0\\'
+_INVALID_PATH_CHARS_PATTERN = re_compile(f'[{re_escape(_INVALID_PATH_CHARS)}]')
+
+# The DriveItem properties that we read, requested with $select to keep the responses small
+_CORE_SELECT = 'id,eTag,name,size,folder,fileSystemInfo,createdDateTime,lastModifiedDateTime,parentReference'
+# The facets that are only needed for the Info namespace of the same name
+_FACET_SELECTS = {'photo': 'photo', 'image': 'image', 'location': 'location', 'hashes': 'file'}
+_ITEM_SELECT = ','.join([_CORE_SELECT, *_FACET_SELECTS.values()])
+
+# Graph timestamps look like 2017-08-07T16:16:30Z or 2017-08-07T16:16:30.123Z, sometimes with 7 digits of fractional seconds
+_DATETIME_PATTERN = re_compile(r'(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.(\d+))?Z')
+
+def _DateTimeFields(dt):
+	# much faster than strptime, which parses the format string on every call
+	match = _DATETIME_PATTERN.fullmatch(dt)
+	if match is None:
+		raise ValueError(f'Unexpected datetime format: {dt}')
+	return match.groups('')
+
+# Items in the same folder often share timestamps, e.g. after a bulk upload, and a cache hit is cheaper than matching the pattern
+@lru_cache(maxsize=4096)
 def _ParseDateTime(dt):
-	try:
-		return datetime.strptime(dt, '%Y-%m-%dT%H:%M:%S.%fZ')
-	except ValueError:
-		return datetime.strptime(dt, '%Y-%m-%dT%H:%M:%SZ')
+	year, month, day, hour, minute, second, fraction = _DateTimeFields(dt)
+	return datetime(int(year), int(month), int(day), int(hour), int(minute), int(second), int(fraction[:6].ljust(6, '0'))) # datetime only has microseconds
+
+@lru_cache(maxsize=4096)
+def _ParseEpoch(dt):
+	# same as datetime_to_epoch(_ParseDateTime(dt)) without building the intermediate datetime
+	return timegm(tuple(map(int, _DateTimeFields(dt)[:6])))
 
 def _FormatDateTime(dt):
 	return dt.astimezone(timezone.utc).replace(tzinfo=None).isoformat() + 'Z'
 
-def _UpdateDict(dict_, sourceKey, targetKey, processFn=None):
-	if sourceKey in dict_:
-		return {targetKey: processFn(dict_[sourceKey]) if processFn is not None else dict_[sourceKey]}
-	return {}
+def _FormatEpoch(epoch):
+	# OneDrive expects naive UTC datetimes
+	return datetime.fromtimestamp(epoch, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+# (DriveItem key, Info key, conversion) for the facets that are copied into Info namespaces
+_PHOTO_FIELDS = (
+	('cameraMake', 'camera_make', None),
+	('cameraModel', 'camera_model', None),
+	('exposureDenominator', 'exposure_denominator', None),
+	('exposureNumerator', 'exposure_numerator', None),
+	('focalLength', 'focal_length', None),
+	('fNumber', 'f_number', None),
+	('takenDateTime', 'taken_date_time', _ParseDateTime),
+	('iso', 'iso', None),
+)
+
+_IMAGE_FIELDS = (
+	('width', 'width', None),
+	('height', 'height', None),
+)
+
+_LOCATION_FIELDS = (
+	('altitude', 'altitude', None),
+	('latitude', 'latitude', None),
+	('longitude', 'longitude', None),
+)
+
+# The spec is at https://docs.microsoft.com/en-us/onedrive/developer/rest-api/resources/hashes
+_HASH_FIELDS = (
+	('crc32Hash', 'CRC32', None), # CRC32 appears in the spec but not in the implementation
+	('sha1Hash', 'SHA1', None), # Standard SHA1
+	('quickXorHash', 'quickXorHash', None), # proprietary hash for change detection
+)
+
+# The facets that become Info namespaces of the same name
+_FACET_FIELDS = (
+	('photo', _PHOTO_FIELDS),
+	('image', _IMAGE_FIELDS),
+	('location', _LOCATION_FIELDS),
+)
+
+def _MapFields(dict_, fields):
+	return {targetKey: dict_[sourceKey] if processFn is None else processFn(dict_[sourceKey]) for sourceKey, targetKey, processFn in fields if sourceKey in dict_}
+
+def _ParseJson(response):
+	# used for every Graph response, the listings and item lookups in particular can be large and numerous
+	return loads(response.content)
+
+def _BasicInfo(item):
+	return Info({'basic': {'name': item['name'], 'is_dir': 'folder' in item}})
+
+@lru_cache(maxsize=4096)
+def _NormalisePath(path):
+	# validatepath runs for every call and the same paths come up over and over again
+	return abspath(normpath(path))
+
+@lru_cache(maxsize=32)
+def _ParseMode(mode):
+	# there are only a handful of distinct mode strings and Mode's properties don't depend on anything else
+	return Mode(mode)
+
+def _NextChunkSize(chunkSize, seconds):
+	# fewer, bigger requests on a fast connection, smaller ones that are less likely to time out on a slow one
+	if seconds < _FAST_FRAGMENT_SECONDS:
+		return min(chunkSize * 2, _MAX_UPLOAD_CHUNK_SIZE)
+	if seconds > _SLOW_FRAGMENT_SECONDS:
+		return max(chunkSize // 2 // _UPLOAD_FRAGMENT_UNIT * _UPLOAD_FRAGMENT_UNIT, _UPLOAD_FRAGMENT_UNIT)
+	return chunkSize
+
+def _CacheKey(path):
+	# OneDrive paths are case-insensitive
+	return path.lower()
+
+def _IsSameOrBelow(path, parent):
+	return path == parent or path.startswith(parent.rstrip('/') + '/')
 
 def _HandleError(response):
 	# https://docs.microsoft.com/en-us/onedrive/developer/rest-api/concepts/errors
@@ -41,40 +181,45 @@ def _HandleError(response):
 	response.raise_for_status()
 
 class _UploadOnClose(BytesIO):
-	def __init__(self, session, path, itemId, mode):
+	def __init__(self, session, path, itemId, mode, *, stat, invalidate, chunkSize):
 		self.session = session
 		self.path = path
 		self.itemId = itemId
 		self.parsedMode = mode
-		initialData = None
-		if (self.parsedMode.appending or self.parsedMode.reading) and not self.parsedMode.truncate:
-			response = self.session.get_path(path, '/content')
-			assert response.status_code != codes.partial, 'Partial content response'
-			if response.status_code == codes.not_found:
-				if not self.parsedMode.appending:
-					raise ResourceNotFound(path)
-			else:
-				response.raise_for_status()
-				initialData = response.content
-
-		super().__init__(initialData)
-		if self.parsedMode.appending and initialData is not None:
-			# seek to the end
-			self.seek(len(initialData))
+		self.stat = stat
+		self.invalidate = invalidate
+		self.chunkSize = chunkSize
+		super().__init__()
+		# when writing, openbin has already looked the item up, so there is nothing to download for a new file
+		if (self.parsedMode.appending or self.parsedMode.reading) and not self.parsedMode.truncate and (itemId is not None or not self.parsedMode.writing):
+			with self.session.get_path(path, '/content', stream=True) as response:
+				assert response.status_code != codes.partial, 'Partial content response'
+				if response.status_code == codes.not_found:
+					if not self.parsedMode.appending:
+						raise ResourceNotFound(path)
+				else:
+					response.raise_for_status()
+					# write the download into the buffer as it arrives instead of joining it into response.content first
+					for chunk in response.iter_content(chunk_size=_DOWNLOAD_CHUNK_SIZE):
+						super().write(chunk)
+			if not self.parsedMode.appending:
+				# appending leaves the position at the end
+				self.seek(0)
 		self._closed = False
 
 	def truncate(self, size=None):
 		# BytesIO.truncate works as needed except if truncating to longer than the existing size
-		originalSize = len(self.getvalue())
-		super().truncate(size)
-		if size is None: # Bytes.truncate works fine for this case
-			return len(self.getvalue())
-		if size <= originalSize: # BytesIO.truncate works fine for this case
-			return len(self.getvalue())
+		with self.getbuffer() as buffer:
+			originalSize = len(buffer)
+		if size is None or size <= originalSize:
+			return super().truncate(size)
 		# this is the behavior of native files and is specified by pyfilesystem2
-		self.write(b'\0' * (size - originalSize))
-		self.seek(originalSize)
-		return len(self.getvalue())
+		# writing past the end makes BytesIO fill the gap with zeros, so there's no need to write them ourselves
+		position = self.tell()
+		self.seek(size - 1)
+		self.write(b'\0')
+		self.seek(position)
+		return size
 
 	def read(self, size=-1):
 		if self.parsedMode.reading is False:
@@ -100,52 +245,75 @@ class _UploadOnClose(BytesIO):
 	def mode(self):
 		return self.parsedMode.to_platform_bin()
 
-	def _ResumableUpload(self, itemId, filename):
-		uploadInfo = self.session.post_item(itemId, f':/{filename}:/createUploadSession')
-		uploadInfo.raise_for_status()
-		uploadUrl = uploadInfo.json()['uploadUrl']
-		size = len(self.getvalue())
-		bytesSent = 0
-		while bytesSent < size:
-			# data size should be a multiple of 320 KiB
-			length = min(320 * 1024, size - bytesSent)
-			dataToSend = self.getvalue()[bytesSent:bytesSent + length]
-			assert len(dataToSend) == length
-			headers = {'content-range': f'bytes {bytesSent}-{bytesSent + length - 1}/{size}'}
-			response = self.session.put(uploadUrl, data=dataToSend, headers=headers)
-			if response.status_code == codes.conflict:
-				_log.warning(f'Retrying upload due to {response}')
+	def _UploadFragment(self, uploadUrl, dataToSend, start, size):
+		headers = {'content-range': f'bytes {start}-{start + len(dataToSend) - 1}/{size}'}
+		response = retry_on_conflict(lambda: self.session.put(uploadUrl, data=dataToSend, headers=headers))
+		if response.ok is False:
+			_log.warning(f'Resumable upload error: {response.status_code} - {response.content}')
+			if response.status_code == codes.unauthorized:
+				_log.warning('Retrying due to 401 error')
 				response = self.session.put(uploadUrl, data=dataToSend, headers=headers)
-			if response.ok is False:
-				_log.warning(f'Resumable upload error: {response.status_code} - {response.content}')
-				if response.status_code == codes.unauthorized:
-					_log.warning('Retrying due to 401 error')
-					response = self.session.put(uploadUrl, data=dataToSend, headers=headers)
+		response.raise_for_status()
+
+	def _ResumableUpload(self, itemId, extra, data):
+		uploadInfo = self.session.post_item(itemId, extra)
+		if uploadInfo.status_code == codes.not_found:
+			raise ResourceNotFound(self.path)
+		uploadInfo.raise_for_status()
+		uploadUrl = _ParseJson(uploadInfo)['uploadUrl']
+		size = len(data)
+		# the fragments have to be uploaded in order - the upload session rejects out of order or overlapping ranges
+		start = 0
+		length = self.chunkSize
+		while start < size:
+			fragment = data[start:start + length]
+			began = perf_counter()
+			self._UploadFragment(uploadUrl, fragment, start, size)
+			length = _NextChunkSize(length, perf_counter() - began)
+			start += len(fragment)
+
+	def _UploadVersion(self, data):
+		# upload a new version, which doesn't need the parent
+		if len(data) < SIMPLE_UPLOAD_LIMIT:
+			# workaround for possible OneDrive bug
+			response = retry_on_conflict(lambda: self.session.put_item(self.itemId, '/content', data=data))
+			if response.status_code == codes.not_found:
+				raise ResourceNotFound(self.path)
 			response.raise_for_status()
-			bytesSent += length
+		else:
+			self._ResumableUpload(self.itemId, '/createUploadSession', data)
 
 	def close(self):
 		if self.parsedMode.writing:
-			response = self.session.get_path(dirname(self.path))
-			response.raise_for_status()
-			parentId = response.json()['id']
-			filename = basename(self.path)
-			if self.itemId is None:
-				# we have to create a new file
-				if len(self.getvalue()) < SIMPLE_UPLOAD_LIMIT:
-					response = self.session.put_item(parentId, f':/{filename}:/content', data=self.getvalue())
-					response.raise_for_status()
-				else:
-					self._ResumableUpload(parentId, filename)
-			elif len(self.getvalue()) < SIMPLE_UPLOAD_LIMIT: # upload a new version
-				response = self.session.put_item(self.itemId, '/content', data=self.getvalue())
-				# workaround for possible OneDrive bug
-				if response.status_code == codes.conflict:
-					_log.warning(f'Retrying upload due to {response}')
-					response = self.session.put_item(self.itemId, '/content', data=self.getvalue())
-				response.raise_for_status()
-			else:
-				self._ResumableUpload(parentId, filename)
+			try:
+				# getbuffer gives a view of the contents instead of the copy that getvalue makes
+				with self.getbuffer() as data:
+					size = len(data)
+					if self.itemId is not None:
+						try:
+							self._UploadVersion(data)
+						except ResourceNotFound:
+							# the item id may have come from the cache, and another client has deleted the file since, so create it again
+							self.invalidate(self.path)
+							self.itemId = None
+					if self.itemId is None:
+						# we have to create a new file
+						# usually cached, since openbin has just checked that the parent exists
+						parentItem = self.stat(dirname(self.path))
+						if parentItem is None:
+							raise ResourceNotFound(dirname(self.path))
+						parentId = parentItem['id']
+						filename = basename(self.path)
+						if size < SIMPLE_UPLOAD_LIMIT:
+							response = self.session.put_item(parentId, f':/{filename}:/content', data=data)
+							if response.status_code == codes.not_found:
+								raise ResourceNotFound(dirname(self.path))
+							response.raise_for_status()
+						else:
+							self._ResumableUpload(parentId, f':/{filename}:/createUploadSession', data)
+			finally:
+				# a failed upload may still have created or changed the item, so don't keep what was cached for it
+				self.invalidate(self.path)
 		self._closed = True
 
 class SubOneDriveFS(SubFS):
@@ -153,6 +321,13 @@ class SubOneDriveFS(SubFS):
 		fs, pathDelegate = self.delegate_path(path)
 		return fs.download_as_format(pathDelegate, output_file, format, **options)
 
+	def getinfo_many(self, paths, namespaces=None):
+		return self.delegate_fs().getinfo_many([self.delegate_path(path)[1] for path in paths], namespaces)
+
+	def clear_cache(self, path='/'):
+		fs, pathDelegate = self.delegate_path(path)
+		return fs.clear_cache(pathDelegate)
+
 	def create_subscription(self, notification_url, expiration_date_time, client_state):
 		return self.delegate_fs().create_subscription(notification_url, expiration_date_time, client_state)
 
@@ -162,10 +337,36 @@ class SubOneDriveFS(SubFS):
 	def update_subscription(self, id_, expiration_date_time):
 		return self.delegate_fs().update_subscription(id_, expiration_date_time)
 
+class _OAuth2Session(OAuth2Session):
+	# OAuth2Session only refreshes once the token has expired, so a token that expires during a long request (e.g. an upload) fails with 401
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		# requests can come from more than one thread (e.g. prefetching the next page of a listing), and refresh tokens can only be used once
+		self._refreshLock = Lock()
+
+	def _NeedsRefresh(self):
+		return self.auto_refresh_url and self.token and 'refresh_token' in self.token and self.token.get('expires_at', float('inf')) - time() < _TOKEN_REFRESH_MARGIN
+
+	def request(self, method, url, *args, withhold_token=False, **kwargs):
+		if withhold_token is False and self._NeedsRefresh():
+			with self._refreshLock:
+				# another thread may have refreshed the token while this one waited
+				if self._NeedsRefresh():
+					_log.debug('Refreshing access token before it expires')
+					token = self.refresh_token(self.auto_refresh_url)
+					if self.token_updater:
+						self.token_updater(token)
+		return super().request(method, url, *args, withhold_token=withhold_token, **kwargs)
+
 class OneDriveSession:
-	def __init__(self, drive_root, session: Session):
+	def __init__(self, drive_root, session: Session, service_root='https://graph.microsoft.com/v1.0'):
 		self._drive_root = drive_root
+		self._root_url = f'{drive_root}/root'
+		self._items_prefix = f'{drive_root}/items/'
+		self._service_root = service_root
 		self.session = session
+		# throttling holds up the requests of this session only, other drives and accounts have their own limits
+		self.throttleDeadline = ThrottleDeadline()
 
 	@throttle()
 	def get(self, *args, **kwargs):
@@ -187,28 +388,61 @@ class OneDriveSession:
 	def delete(self, *args, **kwargs):
 		return self.session.delete(*args, **kwargs)
 
-	def path_url(self, path, extra):
+	@staticmethod
+	def _with_select(url, extra, select):
+		# extra may already contain a query string
+		if select is None:
+			return url
+		separator = '&' if '?' in extra else '?'
+		return f'{url}{separator}$select={select}'
+
+	def path_url(self, path, extra, select=None):
 		# the path must start with '/'
 		if path in {'/', ''}: # special handling for the root directory
-			return f'{self._drive_root}/root{extra}'
-		if extra != '':
-			extra = ':' + extra
-		return f'{self._drive_root}/root:{path}{extra}'
-
-	def item_url(self, itemId, extra):
-		return f'{self._drive_root}/items/{itemId}{extra}'
-
-	def get_path(self, path, extra='', **kwargs):
-		return self.get(self.path_url(path, extra), **kwargs)
+			return self._with_select(self._root_url + extra, extra, select)
+		return self._with_select(f'{self._root_url}:{path}:{extra}' if extra else f'{self._root_url}:{path}', extra, select)
+
+	def item_url(self, itemId, extra, select=None):
+		return self._with_select(f'{self._items_prefix}{itemId}{extra}', extra, select)
+
+	def batch(self, requests_):
+		# Sends up to _BATCH_LIMIT (method, url) pairs in a single round trip and returns the sub-responses in the same order
+		assert len(requests_) <= _BATCH_LIMIT
+		results = {}
+		# requests quotes the URLs that it sends itself, but these go in the JSON body, so quote them the same way
+		pending = {str(index): {'id': str(index), 'method': method, 'url': requote_uri(url)[len(self._service_root):]} for index, (method, url) in enumerate(requests_)}
+		attempt = 0
+		while pending:
+			response = self.post(f'{self._service_root}/$batch', json={'requests': list(pending.values())})
+			_HandleError(response)
+			retryAfterSeconds = 0
+			for subResponse in _ParseJson(response)['responses']:
+				if subResponse['status'] == codes.too_many_requests:
+					retryAfterSeconds = max(retryAfterSeconds, retry_after_delay(subResponse.get('headers', {}), attempt))
+					continue
+				results[subResponse['id']] = subResponse
+				del pending[subResponse['id']]
+			if pending:
+				_log.info(f'Sleeping for {retryAfterSeconds} sec after throttling of {len(pending)} batched requests')
+				# the next post waits for the deadline, as does everything else sent through this session
+				self.throttleDeadline.extend(retryAfterSeconds)
+				attempt += 1
+		return [results[str(index)] for index in range(len(requests_))]
+
+	def get_path(self, path, extra='', select=None, **kwargs):
+		return self.get(self.path_url(path, extra, select), **kwargs)
 
 	def post_path(self, path, extra='', **kwargs):
 		return self.post(self.path_url(path, extra), **kwargs)
 
+	def patch_path(self, path, extra='', **kwargs):
+		return self.patch(self.path_url(path, extra), **kwargs)
+
 	def delete_path(self, path, extra='', **kwargs):
 		return self.delete(self.path_url(path, extra), **kwargs)
 
-	def get_item(self, path, extra='', **kwargs):
-		return self.get(self.item_url(path, extra), **kwargs)
+	def get_item(self, path, extra='', select=None, **kwargs):
+		return self.get(self.item_url(path, extra, select), **kwargs)
 
 	def patch_item(self, path, extra='', **kwargs):
 		return self.patch(self.item_url(path, extra), **kwargs)
@@ -226,9 +460,18 @@ class OneDriveFS(FS):
 	subfs_class = SubOneDriveFS
 	_service_root = 'https://graph.microsoft.com/v1.0'
 
-	def __init__(self, clientId=None, clientSecret=None, token=None, SaveToken=None, tenant='consumers', session=None, **kwargs):
+	def __init__(self, clientId=None, clientSecret=None, token=None, SaveToken=None, tenant='consumers', session=None, uploadChunkSize=DEFAULT_UPLOAD_CHUNK_SIZE, **kwargs):
 		super().__init__()
 
+		if uploadChunkSize % _UPLOAD_FRAGMENT_UNIT != 0 or not 0 < uploadChunkSize <= _MAX_UPLOAD_CHUNK_SIZE:
+			raise ValueError(f'uploadChunkSize must be a multiple of {_UPLOAD_FRAGMENT_UNIT} bytes and no more than {_MAX_UPLOAD_CHUNK_SIZE} bytes')
+		self._uploadChunkSize = uploadChunkSize
+
+		# DriveItem JSON keyed by path, short-lived so that changes made by other clients show up quickly
+		self._itemCache = TTLCache(maxsize=1024, ttl=5)
+		# Partial DriveItems (at least name and folder) from listings, enough to tell whether a path exists and whether it's a folder
+		self._typeCache = TTLCache(maxsize=1024, ttl=5)
+
 		self.set_drive(**kwargs)
 
 		if session is None:
@@ -237,22 +480,24 @@ class OneDriveFS(FS):
 			if clientSecret is not None:
 				auto_refresh_kwargs['client_secret'] = clientSecret
 
-			session = OAuth2Session(
+			session = _OAuth2Session(
 				client_id=clientId,
 				token=token,
 				auto_refresh_kwargs=auto_refresh_kwargs,
 				auto_refresh_url=f'https://login.microsoftonline.com/{tenant}/oauth2/v2.0/token',
 				token_updater=SaveToken,
 			)
+			session.mount('https://', _SHARED_ADAPTER)
 
 		self.session = OneDriveSession(
 			drive_root=self._drive_root,
-			session=session
+			session=session,
+			service_root=self._service_root
 		)
 
 		self._meta = {
 			'case_insensitive': True,
-			'invalid_path_chars': ':\0\\',
+			'invalid_path_chars': _INVALID_PATH_CHARS,
 			'max_path_length': None, # don't know what the limit is
 			'max_sys_path_length': None, # there's no syspath
 			'network': True,
@@ -284,6 +529,17 @@ class OneDriveFS(FS):
 			_log.debug(f'Drive set to {self._resource_root}')
 
 			self._drive_root = f'{self._service_root}/{self._resource_root}'
+			self._itemCache.clear()
+			self._typeCache.clear()
+
+	def validatepath(self, path):
+		# Same checks as the base class, which copies the meta dictionary and looks for a syspath on every call
+		self.check()
+		if isinstance(path, bytes):
+			raise TypeError('paths must be str (not bytes)')
+		if _INVALID_PATH_CHARS_PATTERN.search(path) is not None:
+			raise InvalidCharsInPath(path)
+		return _NormalisePath(path)
 
 	def download_as_format(self, path, output_file, format, **options): # noqa: A002
 		_log.info(f'download_as_format({path}, {output_file}, {format}, {options})')
@@ -294,13 +550,14 @@ class OneDriveFS(FS):
 				raise ValueError('Format jpg requires integer width and height arguments')
 			options['format'] = format
 			optionsString = urlencode(options)
-			response = self.session.get_path(path, f'/content?{optionsString}')
-			assert response.status_code != codes.partial, 'Partial content response'
-			if response.status_code == codes.not_found:
-				raise ResourceNotFound(path)
-			response.raise_for_status()
+			with self.session.get_path(path, f'/content?{optionsString}', stream=True) as response:
+				assert response.status_code != codes.partial, 'Partial content response'
+				if response.status_code == codes.not_found:
+					raise ResourceNotFound(path)
+				response.raise_for_status()
 
-			output_file.write(response.content)
+				for chunk in response.iter_content(chunk_size=_DOWNLOAD_CHUNK_SIZE):
+					output_file.write(chunk)
 
 	def create_subscription(self, notification_url, expiration_date_time, client_state):
 		_log.info(f'create_subscription({notification_url}, {expiration_date_time}, {client_state})')
@@ -315,7 +572,7 @@ class OneDriveFS(FS):
 			response = self.session.post(f'{self._service_root}/subscriptions', json=payload)
 			_HandleError(response) # this is backup, if actual errors are thrown from here we should respond to them individually, e.g. if validation fails
 			assert response.status_code == codes.created, 'Expected 201 Created response'
-			subscription = response.json()
+			subscription = _ParseJson(response)
 			assert subscription['changeType'] == payload['changeType']
 			assert subscription['notificationUrl'] == payload['notificationUrl']
 			assert subscription['resource'] == payload['resource']
@@ -337,61 +594,99 @@ class OneDriveFS(FS):
 			response = self.session.patch(f'{self._service_root}/subscriptions/{id_}', json={'expirationDateTime': _FormatDateTime(expiration_date_time)})
 			response.raise_for_status() # this is backup, if actual errors are thrown from here we should respond to them individually, e.g. if validation fails
 			assert response.status_code == codes.ok, 'Expected 200 OK'
-			subscription = response.json()
+			subscription = _ParseJson(response)
 			assert subscription['id'] == id_
 			assert 'expirationDateTime' in subscription
 
+	def _stat(self, path):
+		# Returns the DriveItem dictionary for path or None if it doesn't exist
+		key = _CacheKey(path)
+		item = self._itemCache.get(key)
+		if item is not None:
+			return item
+		# an expired entry can be revalidated, which is a smaller response if the item hasn't changed
+		staleItem = self._itemCache.get_stale(key)
+		headers = {'If-None-Match': staleItem['eTag']} if staleItem is not None and 'eTag' in staleItem else {}
+		response = self.session.get_path(path, select=_ITEM_SELECT, headers=headers)
+		if response.status_code == codes.not_modified:
+			item = staleItem
+		else:
+			if response.status_code == codes.not_found:
+				self._itemCache.pop(key)
+				self._typeCache.pop(key)
+				return None
+			response.raise_for_status()
+			item = _ParseJson(response)
+		self._itemCache[key] = item
+		return item
+
+	def _statMany(self, paths):
+		# Like _stat for several paths, with the lookups that miss the cache sent as JSON batches
+		items = [self._itemCache.get(_CacheKey(path)) for path in paths]
+		missing = [index for index, item in enumerate(items) if item is None]
+		if len(missing) == 1:
+			items[missing[0]] = self._stat(paths[missing[0]])
+			return items
+		for start in range(0, len(missing), _BATCH_LIMIT):
+			indices = missing[start:start + _BATCH_LIMIT]
+			subResponses = self.session.batch([('GET', self.session.path_url(paths[index], '', select=_ITEM_SELECT)) for index in indices])
+			for index, subResponse in zip(indices, subResponses):
+				if subResponse['status'] == codes.not_found:
+					continue
+				if subResponse['status'] >= codes.bad_request:
+					raise HTTPError(f"{subResponse['status']} error looking up {paths[index]}: {subResponse.get('body')}")
+				items[index] = subResponse['body']
+				self._itemCache[_CacheKey(paths[index])] = items[index]
+		return items
+
+	def _statType(self, path):
+		# Like _stat, but a listing's partial item will do since only the name and folder facet are used
+		item = self._typeCache.get(_CacheKey(path))
+		return item if item is not None else self._stat(path)
+
+	def _invalidate(self, path):
+		# Forget path, everything below it and everything above it, since folder sizes and timestamps follow their contents
+		key = _CacheKey(path)
+		self._itemCache.discard_if(lambda cachedKey: _IsSameOrBelow(cachedKey, key) or _IsSameOrBelow(key, cachedKey))
+		self._typeCache.discard_if(lambda cachedKey: _IsSameOrBelow(cachedKey, key))
+
 	# Translates OneDrive DriveItem dictionary to an fs Info object
-	def _itemInfo(self, item):
+	def _itemInfo(self, item, namespaces=None):
 		# Looks like the dates returned directly in item.file_system_info (i.e. not file_system_info) are UTC naive-datetimes
 		# We're supposed to return timestamps, which the framework can convert to UTC aware-datetimes
+		def wanted(namespace):
+			# None means all namespaces, otherwise only build the ones that were asked for
+			return namespaces is None or namespace in namespaces
+
+		isDir = 'folder' in item
 		rawInfo = {
 			'basic': {
 				'name': item['name'],
-				'is_dir': 'folder' in item,
+				'is_dir': isDir,
 			},
-			'details': {
+		}
+		if wanted('details'):
+			rawInfo['details'] = {
 				'accessed': None, # not supported by OneDrive
-				'created': datetime_to_epoch(_ParseDateTime(item['createdDateTime'])),
+				'created': _ParseEpoch(item['createdDateTime']),
 				'metadata_changed': None, # not supported by OneDrive
-				'modified': datetime_to_epoch(_ParseDateTime(item['lastModifiedDateTime'])),
+				'modified': _ParseEpoch(item['lastModifiedDateTime']),
 				'size': item['size'],
-				'type': ResourceType.directory if 'folder' in item else ResourceType.file,
-			},
-			'file_system_info': {
-				'client_created': datetime_to_epoch(_ParseDateTime(item['fileSystemInfo']['createdDateTime'])),
-				'client_modified': datetime_to_epoch(_ParseDateTime(item['fileSystemInfo']['lastModifiedDateTime']))
+				'type': ResourceType.directory if isDir else ResourceType.file,
 			}
-		}
-		if 'photo' in item:
-			rawInfo['photo'] = {}
-			rawInfo['photo'].update(_UpdateDict(item['photo'], 'cameraMake', 'camera_make'))
-			rawInfo['photo'].update(_UpdateDict(item['photo'], 'cameraModel', 'camera_model'))
-			rawInfo['photo'].update(_UpdateDict(item['photo'], 'exposureDenominator', 'exposure_denominator'))
-			rawInfo['photo'].update(_UpdateDict(item['photo'], 'exposureNumerator', 'exposure_numerator'))
-			rawInfo['photo'].update(_UpdateDict(item['photo'], 'focalLength', 'focal_length'))
-			rawInfo['photo'].update(_UpdateDict(item['photo'], 'fNumber', 'f_number'))
-			rawInfo['photo'].update(_UpdateDict(item['photo'], 'takenDateTime', 'taken_date_time', _ParseDateTime))
-			rawInfo['photo'].update(_UpdateDict(item['photo'], 'iso', 'iso'))
-		if 'image' in item:
-			rawInfo['image'] = {}
-			rawInfo['image'].update(_UpdateDict(item['image'], 'width', 'width'))
-			rawInfo['image'].update(_UpdateDict(item['image'], 'height', 'height'))
-		if 'location' in item:
-			rawInfo['location'] = {}
-			rawInfo['location'].update(_UpdateDict(item['location'], 'altitude', 'altitude'))
-			rawInfo['location'].update(_UpdateDict(item['location'], 'latitude', 'latitude'))
-			rawInfo['location'].update(_UpdateDict(item['location'], 'longitude', 'longitude'))
-		if 'file' in item and 'hashes' in item['file']:
-			rawInfo['hashes'] = {}
-			# The spec is at https://docs.microsoft.com/en-us/onedrive/developer/rest-api/resources/hashes
-			# CRC32 appears in the spec but not in the implementation
-			rawInfo['hashes'].update(_UpdateDict(item['file']['hashes'], 'crc32Hash', 'CRC32'))
-			# Standard SHA1
-			rawInfo['hashes'].update(_UpdateDict(item['file']['hashes'], 'sha1Hash', 'SHA1'))
-			# proprietary hash for change detection
-			rawInfo['hashes'].update(_UpdateDict(item['file']['hashes'], 'quickXorHash', 'quickXorHash'))
-		if 'tags' in item:
+		if wanted('file_system_info'):
+			fileSystemInfo = item['fileSystemInfo']
+			rawInfo['file_system_info'] = {
+				'client_created': _ParseEpoch(fileSystemInfo['createdDateTime']),
+				'client_modified': _ParseEpoch(fileSystemInfo['lastModifiedDateTime'])
+			}
+		for facet, fields in _FACET_FIELDS:
+			if facet in item and wanted(facet):
+				rawInfo[facet] = _MapFields(item[facet], fields)
+		hashes = item.get('file', {}).get('hashes')
+		if hashes is not None and wanted('hashes'):
+			rawInfo['hashes'] = _MapFields(hashes, _HASH_FIELDS)
+		if 'tags' in item and wanted('tags'):
 			# doesn't work
 			rawInfo.update({'tags':
 				{
@@ -403,23 +698,54 @@ class OneDriveFS(FS):
 		_log.info(f'getinfo({path}, {namespaces})')
 		path = self.validatepath(path)
 		with self._lock:
-			response = self.session.get_path(path)
-			if response.status_code == codes.not_found:
+			item = self._stat(path)
+			if item is None:
 				raise ResourceNotFound(path=path)
-			response.raise_for_status()
-			return self._itemInfo(response.json())
+			return self._itemInfo(item)
+
+	def getinfo_many(self, paths, namespaces=None):
+		_log.info(f'getinfo_many({paths}, {namespaces})')
+		paths = [self.validatepath(path) for path in paths]
+		with self._lock:
+			# the lookups that aren't cached are sent in batches rather than one request per path
+			items = self._statMany(paths)
+			for path, item in zip(paths, items):
+				if item is None:
+					raise ResourceNotFound(path=path)
+			return [self._itemInfo(item) for item in items]
+
+	def clear_cache(self, path='/'):
+		# Items are cached for a few seconds, this is for seeing changes sooner, e.g. when polling for hashes that the server is still calculating
+		_log.info(f'clear_cache({path})')
+		path = self.validatepath(path)
+		with self._lock:
+			self._invalidate(path)
+
+	# non-essential methods - the base class versions build an Info object just to check one field
+	def exists(self, path):
+		_log.info(f'exists({path})')
+		path = self.validatepath(path)
+		with self._lock:
+			return self._statType(path) is not None
+
+	def isdir(self, path):
+		_log.info(f'isdir({path})')
+		path = self.validatepath(path)
+		with self._lock:
+			item = self._statType(path)
+			return item is not None and 'folder' in item
+
+	def isfile(self, path):
+		_log.info(f'isfile({path})')
+		path = self.validatepath(path)
+		with self._lock:
+			item = self._statType(path)
+			return item is not None and 'folder' not in item
 
 	def setinfo(self, path, info): # noqa: C901
 		_log.info(f'setinfo({path}, {info})')
-		def to_datetime(value):
-			return epoch_to_datetime(value).replace(tzinfo=None).isoformat() + 'Z'
-
 		path = self.validatepath(path)
 		with self._lock:
-			response = self.session.get_path(path)
-			if response.status_code == codes.not_found:
-				raise ResourceNotFound(path=path)
-			existingItem = response.json()
 			updatedData = {}
 
 			for namespace in info:
@@ -439,14 +765,14 @@ class OneDriveFS(FS):
 							# incoming datetimes should be utc timestamps, OneDrive expects naive UTC datetimes
 							if 'fileSystemInfo' not in updatedData:
 								updatedData['fileSystemInfo'] = {}
-							updatedData['fileSystemInfo']['createdDateTime'] = to_datetime(value)
+							updatedData['fileSystemInfo']['createdDateTime'] = _FormatEpoch(value)
 						elif name == 'metadata_changed':
 							pass # not supported by OneDrive
 						elif name == 'modified':
 							# incoming datetimes should be utc timestamps, OneDrive expects naive UTC datetimes
 							if 'fileSystemInfo' not in updatedData:
 								updatedData['fileSystemInfo'] = {}
-							updatedData['fileSystemInfo']['lastModifiedDateTime'] = to_datetime(value)
+							updatedData['fileSystemInfo']['lastModifiedDateTime'] = _FormatEpoch(value)
 						elif name == 'size':
 							assert False, "Can't change item size"
 						elif name == 'type':
@@ -456,36 +782,49 @@ class OneDriveFS(FS):
 					else:
 						# ignore namespaces that we don't recognize
 						pass
-			response = self.session.patch_item(existingItem['id'], json=updatedData)
+			if not updatedData:
+				# nothing that OneDrive supports was changed, but the path must still exist
+				if self._stat(path) is None:
+					raise ResourceNotFound(path=path)
+				return
+			# patch by path so that the item id isn't needed, and the updated item isn't used so ask for it not to be returned
+			response = self.session.patch_path(path, json=updatedData, headers={'Prefer': 'return=minimal'})
+			if response.status_code == codes.not_found:
+				raise ResourceNotFound(path=path)
+			self._invalidate(path)
 			response.raise_for_status()
 
 	def listdir(self, path):
 		_log.info(f'listdir({path})')
 		path = self.validatepath(path)
 		with self._lock:
-			return [x.name for x in self.scandir(path)]
+			self._checkDirectory(path)
+			# only the names are needed so don't build Info objects, the folder facet is just for the cache
+			return [child['name'] for child in self._children(path, select='name,folder')]
 
 	def makedir(self, path, permissions=None, recreate=False):
 		_log.info(f'makedir({path}, {permissions}, {recreate})')
 		path = self.validatepath(path)
 		with self._lock:
+			if path == '/':
+				# Trying to recreate the root directory should be a NOP
+				if recreate is False:
+					raise DirectoryExists(path)
+				return SubFS(self, path)
 			parentDir = dirname(path)
 			# parentDir here is expected to have a leading slash
 			assert parentDir[0] == '/'
-			response = self.session.get_path(parentDir)
+
+			# no need to check first, the response tells us whether the parent is missing or the name is taken
+			response = self.session.post_path(parentDir, '/children',
+				json={'name': basename(path), 'folder': {}, '@microsoft.graph.conflictBehavior': 'fail'})
+			self._invalidate(path)
 			if response.status_code == codes.not_found:
 				raise ResourceNotFound(parentDir)
-			response.raise_for_status()
-
-			if recreate is False:
-				response = self.session.get_path(path)
-				if response.status_code != codes.not_found:
+			if response.status_code == codes.conflict:
+				if recreate is False:
 					raise DirectoryExists(path)
-
-			response = self.session.post_path(parentDir, '/children',
-				json={'name': basename(path), 'folder': {}})
-			# Trying to recreate the root directory should be a NOP
-			if response.status_code != codes.conflict or recreate is False or path == '/':
+			else:
 				# TODO - will need to deal with these errors locally but don't know what they are yet
 				response.raise_for_status()
 			# don't need to close this filesystem so we return the non-closing version
@@ -497,103 +836,165 @@ class OneDriveFS(FS):
 		with self._lock:
 			if 't' in mode:
 				raise ValueError('Text mode is not allowed in openbin')
-			parsedMode = Mode(mode)
-			exists = self.exists(path)
-			if parsedMode.exclusive and exists:
+			parsedMode = _ParseMode(mode)
+			if parsedMode.reading and not parsedMode.writing:
+				# the download tells us whether the file exists, so only look the item up if it fails, to report the right error
+				try:
+					return _UploadOnClose(session=self.session, path=path, itemId=None, mode=parsedMode, stat=self._stat, invalidate=self._invalidate, chunkSize=self._uploadChunkSize)
+				except (ResourceNotFound, HTTPError):
+					item = self._stat(path)
+					if item is not None and 'folder' in item:
+						raise FileExpected(path) from None
+					raise
+			item = self._stat(path)
+			if parsedMode.exclusive and item is not None:
 				raise FileExists(path)
-			if parsedMode.reading and not parsedMode.create and not exists:
+			if parsedMode.reading and not parsedMode.create and item is None:
 				raise ResourceNotFound(path)
-			if self.isdir(path):
+			if item is not None and 'folder' in item:
 				raise FileExpected(path)
 			if parsedMode.writing:
 				# make sure that the parent directory exists
 				parentDir = dirname(path)
-				response = self.session.get_path(parentDir)
-				if response.status_code == codes.not_found:
+				if self._stat(parentDir) is None:
 					raise ResourceNotFound(parentDir)
-				response.raise_for_status()
-			itemId = None
-			if exists:
-				response = self.session.get_path(path)
-				response.raise_for_status()
-				itemId = response.json()['id']
-			return _UploadOnClose(session=self.session, path=path, itemId=itemId, mode=parsedMode)
+			itemId = item['id'] if item is not None else None
+			return _UploadOnClose(session=self.session, path=path, itemId=itemId, mode=parsedMode, stat=self._stat, invalidate=self._invalidate, chunkSize=self._uploadChunkSize)
 
 	def remove(self, path):
 		_log.info(f'remove({path})')
 		path = self.validatepath(path)
 		with self._lock:
-			response = self.session.get_path(path)
-			if response.status_code == codes.not_found:
+			itemData = self._stat(path)
+			if itemData is None:
 				raise ResourceNotFound(path)
-			response.raise_for_status()
-			itemData = response.json()
 			if 'folder' in itemData:
 				raise FileExpected(path=path)
 			response = self.session.delete_path(path)
+			self._invalidate(path)
+			# the item may have come from the cache, and another client has deleted it since
+			if response.status_code == codes.not_found:
+				raise ResourceNotFound(path)
 			response.raise_for_status()
 
 	def removedir(self, path):
 		_log.info(f'removedir({path})')
 		path = self.validatepath(path)
 		with self._lock:
-			# need to get the item id for this path
-			response = self.session.get_path(path)
+			# one fresh lookup gives the item id and the number of children, the cached item may have an out of date childCount
+			response = self.session.get_path(path, select='id,folder')
 			if response.status_code == codes.not_found:
 				raise ResourceNotFound(path)
-			itemData = response.json()
+			response.raise_for_status()
+			itemData = _ParseJson(response)
 			if 'folder' not in itemData:
 				raise DirectoryExpected(path)
-
-			response = self.session.get_path(path, '/children')
-			response.raise_for_status()
-			childrenData = response.json()
-			if len(childrenData['value']) > 0:
+			if itemData['folder']['childCount'] > 0:
 				raise DirectoryNotEmpty(path)
 
 			itemId = itemData['id'] # let JSON parsing exceptions propagate for now
 			response = self.session.delete_item(itemId)
+			self._invalidate(path)
 			assert response.status_code == codes.no_content, itemId # this is according to the spec
 
+	def removetree(self, dir_path):
+		_log.info(f'removetree({dir_path})')
+		path = self.validatepath(dir_path)
+		with self._lock:
+			if path == '/':
+				# the root itself mustn't be deleted, only its contents
+				for info in list(self.scandir(path)):
+					if info.is_dir:
+						self.removetree(join(path, info.name))
+					else:
+						self.remove(join(path, info.name))
+				return
+			item = self._stat(path)
+			if item is None:
+				raise ResourceNotFound(path)
+			if 'folder' not in item:
+				raise DirectoryExpected(path)
+			# deleting a folder deletes everything in it, so there's no need to walk the tree and delete items one by one
+			response = self.session.delete_path(path)
+			self._invalidate(path)
+			if response.status_code == codes.not_found:
+				raise ResourceNotFound(path)
+			response.raise_for_status()
+
+	def _checkDirectory(self, path):
+		item = self._statType(path) # assumes path is the full path, starting with "/"
+		if item is None:
+			raise ResourceNotFound(path=path)
+		if 'folder' not in item:
+			_log.debug(f'{item}')
+			raise DirectoryExpected(path=path)
+
+	def _childrenPage(self, path, url):
+		response = self.session.get(url)
+		if response.status_code == codes.not_found:
+			raise ResourceNotFound(path=path)
+		response.raise_for_status()
+		parsedResult = _ParseJson(response)
+		assert '@odata.context' in parsedResult
+		return parsedResult
+
+	def _childrenPages(self, path, select):
+		page = self._childrenPage(path, self.session.path_url(path, '/children?$top=999', select=select)) # assumes path is the full path, starting with "/"
+		if '@odata.nextLink' not in page: # the common case - no need for a thread
+			yield page
+			return
+		# request each page in the background while the previous one is being consumed
+		with ThreadPoolExecutor(max_workers=1) as executor:
+			while page is not None:
+				nextLink = page.get('@odata.nextLink')
+				nextPage = executor.submit(self._childrenPage, path, nextLink) if nextLink else None
+				yield page
+				page = nextPage.result() if nextPage is not None else None
+
+	def _children(self, path, select):
+		# Yields the child DriveItems of path, streaming the pages
+		# select must include name and folder, every listing records which children exist and which are folders, so e.g. a walk doesn't need to check each folder before listing it
+		for page in self._childrenPages(path, select):
+			for item in page['value']:
+				self._typeCache[_CacheKey(join(path, item['name']))] = item
+				yield item
+
+	def _childInfos(self, path, namespaces):
+		facets = [select for namespace, select in _FACET_SELECTS.items() if namespace in namespaces]
+		if len(facets) < len(_FACET_SELECTS):
+			# leave out the facets that weren't asked for - the items aren't complete, so they can't be cached
+			yield from (self._itemInfo(item, namespaces) for item in self._children(path, select=','.join([_CORE_SELECT, *facets])))
+			return
+		# The children are full DriveItems so cache them, then following calls on them don't need another request
+		for item in self._children(path, select=_ITEM_SELECT):
+			self._itemCache[_CacheKey(join(path, item['name']))] = item
+			yield self._itemInfo(item, namespaces)
+
 	# non-essential method - for speeding up walk
 	def scandir(self, path, namespaces=None, page=None):
 		_log.info(f'scandir({path}, {namespaces}, {page})')
 		path = self.validatepath(path)
 		with self._lock:
-			response = self.session.get_path(path) # assumes path is the full path, starting with "/"
-			if response.status_code == codes.not_found:
-				raise ResourceNotFound(path=path)
-			if 'folder' not in response.json():
-				_log.debug(f'{response.json()}')
-				raise DirectoryExpected(path=path)
-			result = []
-			nextLink = self.session.path_url(path, '/children') # assumes path is the full path, starting with "/"
-			while nextLink:
-				response = self.session.get(nextLink)
-				if response.status_code == codes.not_found:
-					raise ResourceNotFound(path=path)
-				parsedResult = response.json()
-				assert '@odata.context' in parsedResult
-				result.extend([self._itemInfo(item) for item in parsedResult['value']])
-				if page is not None and page[1] <= len(result):
-					return result[page[0]: page[1]]
-				nextLink = parsedResult.get('@odata.nextLink')
-			if page is not None:
-				return result[page[0]: page[1]]
-			return result
-
-	def move(self, src_path, dst_path, overwrite=False, preserve_time=False):
+			self._checkDirectory(path)
+		# the basic namespace only needs two properties, so skip fetching and converting the rest unless other namespaces are requested
+		basicOnly = namespaces is None or set(namespaces) <= {'basic'}
+		infos = (_BasicInfo(item) for item in self._children(path, select='name,folder')) if basicOnly else self._childInfos(path, namespaces)
+		if page is not None:
+			return islice(infos, page[0], page[1])
+		return infos
+
+	def move(self, src_path, dst_path, overwrite=False, preserve_time=False): # noqa: C901
 		_log.info(f'move({src_path}, {dst_path}, {overwrite}, {preserve_time})')
 		src_path = self.validatepath(src_path)
 		dst_path = self.validatepath(dst_path)
 		with self._lock:
-			if not overwrite and self.exists(dst_path):
+			parentDir = dirname(dst_path)
+			# look up everything that we might need in one go
+			dstItem, driveItem, parentDirItem = self._statMany([dst_path, src_path, parentDir])
+			if not overwrite and dstItem is not None:
 				raise DestinationExists(dst_path)
-			driveItemResponse = self.session.get_path(src_path)
-			if driveItemResponse.status_code == codes.not_found:
+			if driveItem is None:
 				raise ResourceNotFound(src_path)
-			driveItemResponse.raise_for_status()
-			driveItem = driveItemResponse.json()
 
 			if 'folder' in driveItem:
 				raise FileExpected(src_path)
@@ -601,60 +1002,57 @@ class OneDriveFS(FS):
 			itemUpdate = {}
 
 			newFilename = basename(dst_path)
-			if not self.isdir(dst_path) and newFilename != basename(src_path):
+			if (dstItem is None or 'folder' not in dstItem) and newFilename != basename(src_path):
 				itemUpdate['name'] = newFilename
 
-			parentDir = dirname(dst_path)
 			if parentDir != dirname(src_path):
-				parentDirItem = self.session.get_path(parentDir)
-				if parentDirItem.status_code == codes.not_found:
+				if parentDirItem is None:
 					raise ResourceNotFound(parentDir)
-				parentDirItem.raise_for_status()
-				itemUpdate['parentReference'] = {'id': parentDirItem.json()['id']}
+				itemUpdate['parentReference'] = {'id': parentDirItem['id']}
 
 			itemId = driveItem['id']
-			response = self.session.patch_item(itemId, json=itemUpdate)
-			if response.status_code == codes.conflict and overwrite is True:
-				# delete the existing version and then try again
-				response = self.session.delete_path(dst_path)
-				response.raise_for_status()
-
-				# try again
-				response = self.session.patch_item(itemId, json=itemUpdate)
-				response.raise_for_status()
-				return
-			if response.status_code == codes.conflict and overwrite is False:
-				_log.debug("Retrying move in case it's an erroneous error (see issue #7)")
+			try:
 				response = self.session.patch_item(itemId, json=itemUpdate)
+				if response.status_code == codes.conflict and overwrite is True:
+					# delete the existing version and then try again
+					deleteResponse = self.session.delete_path(dst_path)
+					if deleteResponse.status_code != codes.not_found: # another client may have deleted it already
+						deleteResponse.raise_for_status()
+
+					# try again
+					response = self.session.patch_item(itemId, json=itemUpdate)
+				elif response.status_code == codes.conflict and overwrite is False:
+					_log.debug("Retrying move in case it's an erroneous error (see issue #7)")
+					response = retry_on_conflict(lambda: self.session.patch_item(itemId, json=itemUpdate))
+				# the items may have come from the cache, and another client has moved or deleted them since
+				if response.status_code == codes.not_found:
+					raise ResourceNotFound(src_path)
 				response.raise_for_status()
-				return
-			response.raise_for_status()
+			finally:
+				self._invalidate(src_path)
+				self._invalidate(dst_path)
 
 	def copy(self, src_path, dst_path, overwrite=False, preserve_time=False):
 		_log.info(f'copy({src_path}, {dst_path}, {overwrite}, {preserve_time})')
 		src_path = self.validatepath(src_path)
 		dst_path = self.validatepath(dst_path)
 		with self._lock:
-			if not overwrite and self.exists(dst_path):
+			newParentDir = dirname(dst_path)
+			newFilename = basename(dst_path)
+
+			# look up everything that we need in one go
+			dstItem, driveItem, parentDirItem = self._statMany([dst_path, src_path, newParentDir])
+			if not overwrite and dstItem is not None:
 				raise DestinationExists(dst_path)
 
-			driveItemResponse = self.session.get_path(src_path)
-			if driveItemResponse.status_code == codes.not_found:
+			if driveItem is None:
 				raise ResourceNotFound(src_path)
-			driveItemResponse.raise_for_status()
-			driveItem = driveItemResponse.json()
 
 			if 'folder' in driveItem:
 				raise FileExpected(src_path)
 
-			newParentDir = dirname(dst_path)
-			newFilename = basename(dst_path)
-
-			parentDirResponse = self.session.get_path(newParentDir)
-			if parentDirResponse.status_code == codes.not_found:
+			if parentDirItem is None:
 				raise ResourceNotFound(src_path)
-			parentDirResponse.raise_for_status()
-			parentDirItem = parentDirResponse.json()
 
 			# This just asynchronously starts the copy
 			response = self.session.post_item(driveItem['id'], '/copy?@microsoft.graph.conflictBehavior=replace', json={
@@ -664,14 +1062,20 @@ class OneDriveFS(FS):
 			response.raise_for_status()
 			assert response.status_code == codes.accepted, 'Response code should be 202 (Accepted)'
 			monitorUri = response.headers['Location']
+			attempt = 0
 			while True:
 				# monitor uris don't require authentication
 				# (https://docs.microsoft.com/en-us/onedrive/developer/rest-api/concepts/long-running-actions)
 				jobStatusResponse = get(monitorUri) # noqa: S113
 				jobStatusResponse.raise_for_status()
-				jobStatus = jobStatusResponse.json()
+				jobStatus = _ParseJson(jobStatusResponse)
 				# job status no longer contains an 'operation' field
 				if jobStatus['status'] not in ['inProgress', 'completed', 'notStarted']:
 					_log.warning(f'Unexpected status: {jobStatus}')
 				if jobStatus['status'] == 'completed':
 					break
+				# poll less often the longer the copy takes, unless the service tells us when to come back
+				retryAfter = jobStatusResponse.headers.get('Retry-After')
+				sleep(int(retryAfter) if retryAfter is not None else min(_COPY_POLL_MAX_INTERVAL, 0.25 * 2 ** attempt))
+				attempt += 1
+			self._invalidate(dst_path)
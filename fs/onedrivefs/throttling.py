@@ -1,23 +1,65 @@
 from functools import wraps
 from logging import getLogger
-from time import sleep
+from random import uniform
+from threading import Lock
+from time import monotonic, sleep
 
 from requests import codes
 
 _log = getLogger(__name__)
 
+def backoff_delay(attempt, base=0.5, cap=30):
+	# exponential backoff with full jitter
+	return uniform(0, min(cap, base * 2 ** attempt)) # noqa: S311
+
+def retry_after_delay(headers, attempt):
+	if 'Retry-After' in headers:
+		# a little jitter stops the waiting requests all being sent at the same moment
+		return int(headers['Retry-After']) * uniform(1, 1.25) # noqa: S311
+	return backoff_delay(attempt)
+
+class ThrottleDeadline:
+	# When a request is throttled, the other requests that share the deadline wait until it has passed instead of sending requests that will also be throttled
+	def __init__(self):
+		self._lock = Lock()
+		self._until = 0
+
+	def wait(self):
+		delay = self._until - monotonic()
+		if delay > 0:
+			sleep(delay)
+
+	def extend(self, seconds):
+		with self._lock:
+			self._until = max(self._until, monotonic() + seconds)
+
 def throttle():
+	# decorates methods of objects with a throttleDeadline attribute, so that throttling only holds up requests that go to the same place
 	def decorator(func):
 		@wraps(func)
-		def wrapper(*args, **kwargs):
+		def wrapper(self, *args, **kwargs):
+			attempt = 0
 			while True:
-				resp = func(*args, **kwargs)
+				self.throttleDeadline.wait()
+				resp = func(self, *args, **kwargs)
 				if resp.status_code != codes.too_many_requests:
 					break
 				# look at the response and retry after a delay
-				retryAfterSeconds = int(resp.headers['Retry-After'])
+				retryAfterSeconds = retry_after_delay(resp.headers, attempt)
 				_log.info(f'Sleeping for {retryAfterSeconds} sec after throttling')
-				sleep(retryAfterSeconds)
+				self.throttleDeadline.extend(retryAfterSeconds)
+				attempt += 1
 			return resp
 		return wrapper
 	return decorator
+
+def retry_on_conflict(request, retries=3):
+	# OneDrive sometimes returns 409 for requests that succeed when retried
+	resp = request()
+	for attempt in range(retries):
+		if resp.status_code != codes.conflict:
+			break
+		_log.warning(f'Retrying due to {resp}')
+		sleep(backoff_delay(attempt))
+		resp = request()
+	return resp
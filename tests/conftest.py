@@ -0,0 +1,15 @@
+from fs.onedrivefs import cache
+from pytest import fixture
+
+class FakeClock:
+	def __init__(self):
+		self.now = 1000.0
+
+	def __call__(self):
+		return self.now
+
+@fixture
+def clock(monkeypatch):
+	clock_ = FakeClock()
+	monkeypatch.setattr(cache, 'monotonic', clock_)
+	return clock_
@@ -0,0 +1,36 @@
+from fs.onedrivefs.cache import TTLCache
+
+def test_expiry(clock):
+	ttlCache = TTLCache(maxsize=4, ttl=5)
+	ttlCache['a'] = 'old'
+	clock.now += 4.9
+	assert ttlCache.get('a') == 'old'
+	clock.now += 0.2
+	assert ttlCache.get('a') is None
+	assert ttlCache.get('a', 'default') == 'default'
+	# expired entries are kept so that they can be revalidated
+	assert ttlCache.get_stale('a') == 'old'
+	ttlCache['a'] = 'new'
+	assert ttlCache.get('a') == 'new'
+
+def test_eviction(clock): # noqa: ARG001
+	ttlCache = TTLCache(maxsize=2, ttl=5)
+	ttlCache['a'] = 'A'
+	ttlCache['b'] = 'B'
+	# reading a makes b the least recently used
+	assert ttlCache.get('a') == 'A'
+	ttlCache['c'] = 'C'
+	assert ttlCache.get_stale('b') is None
+	assert ttlCache.get('a') == 'A'
+	assert ttlCache.get('c') == 'C'
+
+def test_pop_and_discard(clock): # noqa: ARG001
+	ttlCache = TTLCache(maxsize=8, ttl=5)
+	for key in ['/a', '/a/b', '/ab', '/c']:
+		ttlCache[key] = key
+	assert ttlCache.pop('/c') == '/c'
+	assert ttlCache.pop('/c', 'missing') == 'missing'
+	ttlCache.discard_if(lambda key: key == '/a' or key.startswith('/a/'))
+	assert [ttlCache.get_stale(key) for key in ['/a', '/a/b', '/ab']] == [None, None, '/ab']
+	ttlCache.clear()
+	assert ttlCache.get_stale('/ab') is None
@@ -0,0 +1,146 @@
+from calendar import timegm
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps
+from threading import Thread
+
+from fs.onedrivefs.onedrivefs import _FormatEpoch, _NextChunkSize, _ParseDateTime, _ParseEpoch, _SHARED_ADAPTER, _UPLOAD_FRAGMENT_UNIT, OneDriveSession
+from pytest import fixture, mark, raises
+from requests import HTTPError, Session
+
+# Tests of the parts of OneDriveFS that don't need a connection to OneDrive
+
+_SERVICE_ROOT = 'https://graph.microsoft.com/v1.0'
+
+class FakeResponse:
+	def __init__(self, body, status_code=200):
+		self.status_code = status_code
+		self.ok = status_code < 400 # noqa: PLR2004
+		self.headers = {}
+		self.content = dumps(body).encode() if body is not None else b''
+		self.text = self.content.decode()
+
+	def raise_for_status(self):
+		if not self.ok:
+			raise HTTPError(f'{self.status_code} error')
+
+class FakeBatchSession:
+	# answers $batch requests with the given sub-responses, one list per request
+	def __init__(self, *responses):
+		self.responses = list(responses)
+		self.batches = []
+
+	def post(self, url, json):
+		assert url == f'{_SERVICE_ROOT}/$batch'
+		self.batches.append(json['requests'])
+		return FakeResponse({'responses': self.responses.pop(0)})
+
+def test_batch_quotes_urls():
+	fakeSession = FakeBatchSession(
+		[{'id': '0', 'status': 200, 'body': {'name': 'my file.txt'}}, {'id': '1', 'status': 429, 'headers': {'Retry-After': '0'}}],
+		[{'id': '1', 'status': 404, 'body': {}}])
+	session = OneDriveSession(f'{_SERVICE_ROOT}/me/drive', fakeSession, _SERVICE_ROOT)
+	results = session.batch([('GET', session.path_url('/my file.txt', '')), ('GET', session.path_url('/dossier/café.txt', ''))])
+	assert [x['status'] for x in results] == [200, 404]
+	assert [x['url'] for x in fakeSession.batches[0]] == ['/me/drive/root:/my%20file.txt', '/me/drive/root:/dossier/caf%C3%A9.txt']
+	# only the throttled request is sent again
+	assert [x['url'] for x in fakeSession.batches[1]] == ['/me/drive/root:/dossier/caf%C3%A9.txt']
+
+class ThrottlingHandler(BaseHTTPRequestHandler):
+	# throttles the first request, then answers normally
+	requestCount = 0
+
+	def do_GET(self):
+		ThrottlingHandler.requestCount += 1
+		if ThrottlingHandler.requestCount == 1:
+			self.send_response(429)
+			self.send_header('Retry-After', '0')
+		else:
+			self.send_response(200)
+		self.send_header('Content-Length', '0')
+		self.end_headers()
+
+	def log_message(self, *args):
+		pass
+
+@fixture
+def throttlingServer():
+	ThrottlingHandler.requestCount = 0
+	server = ThreadingHTTPServer(('127.0.0.1', 0), ThrottlingHandler)
+	thread = Thread(target=server.serve_forever, daemon=True)
+	thread.start()
+	yield f'http://127.0.0.1:{server.server_port}'
+	server.shutdown()
+	server.server_close()
+
+class RecordingDeadline:
+	def __init__(self):
+		self.extensions = []
+
+	def wait(self):
+		pass
+
+	def extend(self, seconds):
+		self.extensions.append(seconds)
+
+def test_throttling_reaches_session(throttlingServer):
+	# the connection pool mustn't retry a 429 itself, or the other requests of the session wouldn't wait for it
+	requestsSession = Session()
+	requestsSession.mount('http://', _SHARED_ADAPTER)
+	session = OneDriveSession(f'{throttlingServer}/me/drive', requestsSession, throttlingServer)
+	session.throttleDeadline = RecordingDeadline()
+	response = session.get(f'{throttlingServer}/me/drive/root')
+	assert response.ok
+	assert ThrottlingHandler.requestCount == 2 # noqa: PLR2004
+	assert len(session.throttleDeadline.extensions) == 1
+
+def test_next_chunk_size():
+	unit = _UPLOAD_FRAGMENT_UNIT
+	assert unit == 320 * 1024
+	# fast fragments double, slow ones halve, others stay the same size
+	assert _NextChunkSize(32 * unit, 1) == 64 * unit
+	assert _NextChunkSize(32 * unit, 11) == 16 * unit
+	assert _NextChunkSize(32 * unit, 2) == 32 * unit
+	assert _NextChunkSize(32 * unit, 10) == 32 * unit
+	# halving an odd number of units rounds down to a whole unit
+	assert _NextChunkSize(5 * unit, 11) == 2 * unit
+	# fragments must be less than 60 MiB and at least one unit
+	assert _NextChunkSize(128 * unit, 1) == 191 * unit
+	assert _NextChunkSize(191 * unit, 1) == 191 * unit
+	assert 191 * unit < 60 * 1024 * 1024
+	assert _NextChunkSize(unit, 11) == unit
+	# whatever the timings, the size stays a multiple of the unit within the limits
+	size = 32 * unit
+	for seconds in [1, 1, 1, 1, 1, 11, 11, 11, 11, 11, 11, 11, 11, 11, 1]:
+		size = _NextChunkSize(size, seconds)
+		assert size % unit == 0
+		assert unit <= size <= 191 * unit
+
+@mark.parametrize(('text', 'microseconds'), [
+	('2017-08-07T16:16:30Z', 0),
+	('2017-08-07T16:16:30.1Z', 100000),
+	('2017-08-07T16:16:30.12Z', 120000),
+	('2017-08-07T16:16:30.123Z', 123000),
+	('2017-08-07T16:16:30.1234Z', 123400),
+	('2017-08-07T16:16:30.12345Z', 123450),
+	('2017-08-07T16:16:30.123456Z', 123456),
+	('2017-08-07T16:16:30.1234567Z', 123456),
+])
+def test_parse_datetime(text, microseconds):
+	assert _ParseDateTime(text) == datetime(2017, 8, 7, 16, 16, 30, microseconds)
+	# epochs are whole seconds
+	assert _ParseEpoch(text) == timegm((2017, 8, 7, 16, 16, 30))
+
+@mark.parametrize('text', ['2017-08-07T16:16:30', '2017-08-07T16:16:30.123', '2017-08-07 16:16:30Z', '2017-08-07T16:16:30.Z'])
+def test_parse_datetime_invalid(text):
+	with raises(ValueError):
+		_ParseDateTime(text)
+	with raises(ValueError):
+		_ParseEpoch(text)
+
+@mark.parametrize('epoch', [0, 1234567890, 1234567890.5, 1502122590.123456])
+def test_format_epoch(epoch):
+	text = _FormatEpoch(epoch)
+	assert text.endswith('Z')
+	assert _ParseDateTime(text) == datetime.fromtimestamp(epoch, timezone.utc).replace(tzinfo=None)
+	assert _ParseEpoch(text) == int(epoch)
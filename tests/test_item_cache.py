@@ -0,0 +1,224 @@
+from itertools import count
+from json import loads
+
+from fs.errors import ResourceNotFound
+from fs.onedrivefs import OneDriveFS
+from fs.path import basename, dirname, join
+from pytest import mark, raises
+
+from .test_helpers import _SERVICE_ROOT, FakeResponse
+
+# Tests of how OneDriveFS caches items, against a drive held in memory
+
+_DRIVE_ROOT = f'{_SERVICE_ROOT}/me/drive'
+
+class FakeDriveSession:
+	# answers the item, children and $batch requests that OneDriveFS makes, and records them as 'METHOD path extra'
+	def __init__(self, paths):
+		self._ids = count()
+		self.items = {}
+		self.requests = []
+		self.notModifiedCount = 0
+		self.Add('/', folder=True)
+		for path in paths:
+			# folders end with /
+			self.Add(path.rstrip('/'), folder=path.endswith('/'))
+
+	def Add(self, path, folder=False):
+		id_ = str(next(self._ids))
+		item = {
+			'id': id_,
+			'eTag': f'"{id_},1"',
+			'name': basename(path) or 'root',
+			'size': 0,
+			'createdDateTime': '2020-01-01T00:00:00Z',
+			'lastModifiedDateTime': '2020-01-01T00:00:00Z',
+			'fileSystemInfo': {'createdDateTime': '2020-01-01T00:00:00Z', 'lastModifiedDateTime': '2020-01-01T00:00:00Z'},
+			'parentReference': {'driveId': 'drive'},
+		}
+		if folder:
+			item['folder'] = {'childCount': 0}
+		self.items[path.lower()] = item
+		return item
+
+	def Change(self, path):
+		item = self.items[path.lower()]
+		id_, version = item['eTag'].strip('"').split(',')
+		item['eTag'] = f'"{id_},{int(version) + 1}"'
+
+	def _PathOf(self, id_):
+		return next((path for path, item in self.items.items() if item['id'] == id_), None)
+
+	def _Resolve(self, url):
+		# returns the (lower case) path that the url refers to, or None for a missing item id, and what follows it
+		rest = url[len(_DRIVE_ROOT):].partition('?')[0]
+		if rest.startswith('/items/'):
+			rest = rest[len('/items/'):]
+			if ':' in rest: # a child of the item, e.g. /items/{parentId}:/{filename}:/content
+				parentId, name, extra = rest.split(':')
+				parentPath = self._PathOf(parentId)
+				return (join(parentPath, name[1:]) if parentPath is not None else None), extra
+			id_, separator, extra = rest.partition('/')
+			return self._PathOf(id_), separator + extra
+		rest = rest[len('/root'):]
+		if rest.startswith(':'):
+			path, _, extra = rest[1:].partition(':')
+			return path.lower(), extra
+		return '/', rest
+
+	def _Record(self, method, url):
+		path, extra = self._Resolve(url)
+		self.requests.append(f'{method} {path} {extra}'.strip())
+		return path, extra
+
+	def _Get(self, path, extra, headers):
+		item = self.items.get(path) if path is not None else None
+		if item is None:
+			return FakeResponse({'error': {'code': 'itemNotFound'}}, 404)
+		if extra == '/children':
+			return FakeResponse({'@odata.context': 'fake', 'value': [child for childPath, child in self.items.items() if childPath != '/' and dirname(childPath) == path]})
+		if headers.get('If-None-Match') == item['eTag']:
+			self.notModifiedCount += 1
+			return FakeResponse(None, 304)
+		return FakeResponse(item)
+
+	def get(self, url, headers=None, **kwargs): # noqa: ARG002
+		path, extra = self._Record('GET', url)
+		return self._Get(path, extra, headers or {})
+
+	def post(self, url, json=None, **kwargs): # noqa: ARG002
+		assert url == f'{_SERVICE_ROOT}/$batch'
+		self.requests.append('POST $batch')
+		subResponses = []
+		for request in json['requests']:
+			path, extra = self._Record(request['method'], f"{_SERVICE_ROOT}{request['url']}")
+			response = self._Get(path, extra, {})
+			subResponses.append({'id': request['id'], 'status': response.status_code, 'body': loads(response.content)})
+		return FakeResponse({'responses': subResponses})
+
+	def delete(self, url, **kwargs): # noqa: ARG002
+		path, _ = self._Record('DELETE', url)
+		if path is None or path not in self.items:
+			return FakeResponse({'error': {'code': 'itemNotFound'}}, 404)
+		for childPath in [childPath for childPath in self.items if childPath == path or childPath.startswith(path.rstrip('/') + '/')]:
+			del self.items[childPath]
+		return FakeResponse(None, 204)
+
+	def patch(self, url, json=None, **kwargs): # noqa: ARG002
+		# only moves and renames of files
+		path, _ = self._Record('PATCH', url)
+		if path is None or path not in self.items:
+			return FakeResponse({'error': {'code': 'itemNotFound'}}, 404)
+		parentPath = self._PathOf(json['parentReference']['id']) if 'parentReference' in json else dirname(path)
+		newPath = join(parentPath, json.get('name', basename(path))).lower()
+		item = self.items.pop(path)
+		item['name'] = json.get('name', item['name'])
+		self.items[newPath] = item
+		self.Change(newPath)
+		return FakeResponse(item)
+
+	def put(self, url, data=None, **kwargs): # noqa: ARG002
+		path, _ = self._Record('PUT', url)
+		if path is None or self.items.get(dirname(path)) is None:
+			return FakeResponse({'error': {'code': 'itemNotFound'}}, 404)
+		if path in self.items:
+			self.Change(path)
+			return FakeResponse(self.items[path])
+		return FakeResponse(self.Add(path), 201)
+
+@mark.parametrize('namespaces', [None, ['details'], ['details', 'photo', 'image', 'location', 'hashes']])
+def test_walk_lists_each_folder_once(namespaces):
+	session = FakeDriveSession(['/a/', '/a/b/', '/a/c/', '/a/b/d/', '/a/x.txt', '/a/b/y.txt'])
+	fs = OneDriveFS(session=session)
+	assert sorted(join(path, info.name) for path, _, files in fs.walk('/', namespaces=namespaces) for info in files) == ['/a/b/y.txt', '/a/x.txt']
+	# the top folder is looked up, the subfolders are known to exist from the listings of their parents
+	assert session.requests == ['GET /', 'GET / /children', 'GET /a /children', 'GET /a/b /children', 'GET /a/c /children', 'GET /a/b/d /children']
+	assert fs.isdir('/a/b')
+	assert fs.isfile('/a/B/Y.txt')
+	assert not fs.exists('/a/b/d/z.txt')
+	assert session.requests[-1] == 'GET /a/b/d/z.txt'
+
+def test_remove_deleted_by_another_client():
+	session = FakeDriveSession(['/x.txt'])
+	fs = OneDriveFS(session=session)
+	assert fs.getinfo('/x.txt').name == 'x.txt'
+	del session.items['/x.txt']
+	# the cached item says that the file is there, but the delete finds that it isn't
+	with raises(ResourceNotFound):
+		fs.remove('/x.txt')
+	assert not fs.exists('/x.txt')
+
+def test_move_deleted_by_another_client():
+	session = FakeDriveSession(['/x.txt'])
+	fs = OneDriveFS(session=session)
+	fs.getinfo_many(['/', '/x.txt'])
+	del session.items['/x.txt']
+	with raises(ResourceNotFound):
+		fs.move('/x.txt', '/y.txt')
+	assert session.requests[-1] == 'PATCH None'
+	assert not fs.exists('/x.txt')
+
+def test_upload_deleted_by_another_client():
+	session = FakeDriveSession(['/x.txt'])
+	fs = OneDriveFS(session=session)
+	fs.getinfo('/x.txt')
+	del session.items['/x.txt']
+	# the new version can't be uploaded to the deleted item, so the file is created again
+	fs.writebytes('/x.txt', b'data')
+	assert session.requests[-3:] == ['PUT None /content', 'GET /', 'PUT /x.txt /content']
+	assert fs.isfile('/x.txt')
+
+def test_revalidation(clock):
+	session = FakeDriveSession(['/x.txt'])
+	fs = OneDriveFS(session=session)
+	fs.getinfo('/x.txt')
+	fs.getinfo('/x.txt')
+	assert session.requests == ['GET /x.txt']
+	# once the item has expired, it's revalidated with its eTag
+	clock.now += 6
+	fs.getinfo('/x.txt')
+	assert session.requests == ['GET /x.txt', 'GET /x.txt']
+	assert session.notModifiedCount == 1
+	clock.now += 6
+	session.Change('/x.txt')
+	session.items['/x.txt']['size'] = 4
+	assert fs.getinfo('/x.txt', namespaces=['details']).size == 4 # noqa: PLR2004
+	assert session.notModifiedCount == 1
+
+def test_not_found_forgets_item(clock):
+	session = FakeDriveSession(['/x.txt'])
+	fs = OneDriveFS(session=session)
+	fs.getinfo('/x.txt')
+	oldItem = session.items.pop('/x.txt')
+	clock.now += 6
+	assert not fs.exists('/x.txt')
+	# a new file with the old eTag would only be mistaken for the old one if the expired item had been kept
+	session.items['/x.txt'] = dict(oldItem, size=4)
+	assert fs.getinfo('/x.txt', namespaces=['details']).size == 4 # noqa: PLR2004
+	assert session.notModifiedCount == 0
+
+def test_invalidation():
+	paths = ['/', '/a', '/a/b', '/a/b/x.txt', '/a/c.txt', '/ab.txt']
+	session = FakeDriveSession(['/a/', '/a/b/', '/a/b/x.txt', '/a/c.txt', '/ab.txt'])
+	fs = OneDriveFS(session=session)
+	# the lookups that miss the cache go in one batch
+	fs.getinfo_many(paths)
+	assert session.requests == ['POST $batch', *(f'GET {path}' for path in paths)]
+	del session.requests[:]
+	fs.setinfo('/a/b', {'details': {'modified': 0}})
+	# changing a folder forgets the folders above it, whose sizes and timestamps follow their contents, and everything in it
+	fs.getinfo_many(paths)
+	assert session.requests == ['PATCH /a/b', 'POST $batch', 'GET /', 'GET /a', 'GET /a/b', 'GET /a/b/x.txt']
+
+def test_clear_cache():
+	session = FakeDriveSession(['/a/', '/a/x.txt', '/y.txt'])
+	fs = OneDriveFS(session=session)
+	subFS = fs.opendir('/a')
+	fs.getinfo_many(['/a/x.txt', '/y.txt'])
+	del session.requests[:]
+	subFS.clear_cache('x.txt')
+	fs.getinfo_many(['/a/x.txt', '/y.txt'])
+	assert session.requests == ['GET /a/x.txt']
+	fs.clear_cache()
+	fs.getinfo_many(['/a/x.txt', '/y.txt'])
+	assert session.requests[1:] == ['POST $batch', 'GET /a/x.txt', 'GET /y.txt']
@@ -3,19 +3,19 @@ from hashlib import sha1
 from io import BytesIO
 from json import dump, load, loads
 from logging import info, warning
-from os import environ
+from os import environ, getpid, replace
+from threading import Event
 from time import sleep
 from unittest import TestCase
 from urllib.parse import parse_qs, urlencode, urlparse
 from uuid import uuid4
 
+from fs.errors import ResourceNotFound
 from fs.onedrivefs import OneDriveFS, OneDriveFSOpener
 from fs.opener import open_fs, registry
 from fs.subfs import SubFS
 from fs.test import FSTestCases
-from pyngrok import conf, ngrok
 from pytest import fixture, mark, raises
-from pytest_localserver.http import WSGIServer
 
 from .github import UploadSecret
 
@@ -37,8 +37,11 @@ class TokenStorageFile:
 		self.path = path
 
 	def Save(self, token):
-		with open(self.path, 'w', encoding='utf-8') as f:
+		# write a temporary file and move it into place so that the parallel test workers never load a half written token
+		temporaryPath = f'{self.path}.{getpid()}.tmp'
+		with open(temporaryPath, 'w', encoding='utf-8') as f:
 			dump(token, f)
+		replace(temporaryPath, self.path)
 
 	def Load(self):
 		try:
@@ -49,7 +52,7 @@ class TokenStorageFile:
 
 class SimpleApp:
 	def __init__(self):
-		self.notified = False
+		self.notified = Event()
 
 	def __call__(self, environ_, start_response):
 		"""Simplest possible WSGI application"""
@@ -65,11 +68,13 @@ class SimpleApp:
 		inputStream = environ_['wsgi.input']
 		info(f'Input: {inputStream}')
 		info('NOTIFIED')
-		self.notified = True
+		self.notified.set()
 		return ''
 
 @fixture(scope='class')
 def testserver(request):
+	# only imported when test_subscriptions runs, so that collecting the other tests doesn't pay for it
+	from pytest_localserver.http import WSGIServer # noqa: PLC0415
 	server = WSGIServer(application=SimpleApp())
 	request.cls.server = server
 	server.start()
@@ -83,6 +88,49 @@ def CredentialsStorage():
 
 storage = CredentialsStorage() # keep at module level so that it can save and load credentials after refresh
 
+# (namespace, key, value) expected once the server has processed each photo
+_CANON_IXUS_FIELDS = (
+	('photo', 'camera_make', 'Canon'),
+	('photo', 'camera_model', 'Canon DIGITAL IXUS'),
+	('photo', 'exposure_denominator', 350),
+	('photo', 'exposure_numerator', 1),
+	('photo', 'focal_length', 10.8125),
+	('photo', 'f_number', 4.0),
+	('photo', 'taken_date_time', datetime(2001, 6, 9, 15, 17, 32)),
+	('photo', 'iso', None),
+	('image', 'width', 640),
+	('image', 'height', 480),
+)
+
+_DSCN0010_FIELDS = (
+	('photo', 'camera_make', 'NIKON'),
+	('photo', 'camera_model', 'COOLPIX P6000'),
+	('photo', 'exposure_denominator', 300.0),
+	('photo', 'exposure_numerator', 4.0),
+	('photo', 'focal_length', 24.0),
+	('photo', 'f_number', 5.9),
+	('photo', 'taken_date_time', datetime(2008, 10, 22, 16, 28, 39)),
+	('photo', 'iso', 64),
+	('image', 'width', 640),
+	('image', 'height', 480),
+	('location', 'latitude', 43.46744833333334),
+	('location', 'longitude', 11.885126666663888),
+)
+
+def WrongFields(info_, expectedFields):
+	# fields can be missing until the server has processed the photo, but they should never have the wrong value
+	return [(namespace, key, info_.get(namespace, key)) for namespace, key, value in expectedFields if info_.get(namespace, key) not in {None, value}]
+
+def PollWaits(timeout=250, maxSleep=5):
+	# yields the time waited so far, sleeping between polls with a backoff because the server is often done in a second or two
+	waited = 0
+	sleepTime = 1
+	while waited < timeout:
+		yield waited
+		sleep(sleepTime)
+		waited += sleepTime
+		sleepTime = min(sleepTime * 2, maxSleep)
+
 def FullFS():
 	return OneDriveFS(environ['GRAPH_API_CLIENT_ID'], environ['GRAPH_API_CLIENT_SECRET'], storage.Load(), storage.Save)
 
@@ -131,6 +179,7 @@ class TestOneDriveFS(FSTestCases, TestCase, PyFsCompatLayer):
 	@mark.skipif('NGROK_AUTH_TOKEN' not in environ, reason='Missing NGROK_AUTH_TOKEN environment variable')
 	@mark.usefixtures('testserver')
 	def test_subscriptions(self):
+		from pyngrok import conf, ngrok # noqa: PLC0415
 		port = urlparse(self.server.url).port
 		info(f'Port: {port}')
 		info(self.server.url)
@@ -143,15 +192,12 @@ class TestOneDriveFS(FSTestCases, TestCase, PyFsCompatLayer):
 		info(f'subscription id: {id_}')
 		self.fs.touch('touched-file.txt')
 		info('Touched the file, waiting...')
-		# need to wait for some time for the notification to come through, but also process incoming http requests
-		for _ in range(50):
-			if self.server.app.notified is True:
-				break
-			sleep(5)
-		info('Sleep done, deleting subscription')
+		# need to wait for some time for the notification to come through, the server handles incoming http requests on its own thread
+		notified = self.server.app.notified.wait(timeout=250)
+		info('Wait done, deleting subscription')
 		self.fs.delete_subscription(id_)
 		info('subscription deleted')
-		assert self.server.app.notified is True, f'Not notified: {self.server.app.notified}'
+		assert notified, 'Not notified'
 
 	def test_overwrite_file(self):
 		with self.fs.open('small_file_to_overwrite.bin', 'wb') as f:
@@ -179,83 +225,72 @@ class TestOneDriveFS(FSTestCases, TestCase, PyFsCompatLayer):
 			f.write('y' * 4000000)
 
 	def test_photo_metadata(self):
-		with self.fs.open('canon-ixus.jpg', 'wb') as target, open('tests/canon-ixus.jpg', 'rb') as source:
-			target.write(source.read())
+		with open('tests/canon-ixus.jpg', 'rb') as source:
+			self.fs.upload('canon-ixus.jpg', source)
 
 		# sometimes it take a few seconds for the server to process EXIF data
 		# until it's processed, the "photo" section should be missing
-		iterations = 50
-		sleepTime = 5
-		for _ in range(iterations):
+		timeout = 250
+		for _ in PollWaits(timeout):
+			# getinfo is answered from the cache for a few seconds, so forget the item to see what the server has now
+			self.fs.clear_cache('canon-ixus.jpg')
 			info_ = self.fs.getinfo('canon-ixus.jpg')
 
-			self.assertTrue(info_.get('photo', 'camera_make') in {None, 'Canon'})
-			self.assertTrue(info_.get('photo', 'camera_model') in {None, 'Canon DIGITAL IXUS'})
-			self.assertTrue(info_.get('photo', 'exposure_denominator') in {None, 350})
-			self.assertTrue(info_.get('photo', 'exposure_numerator') in {None, 1})
-			self.assertTrue(info_.get('photo', 'focal_length') in {None, 10.8125})
-			self.assertTrue(info_.get('photo', 'f_number') in {None, 4.0})
-			self.assertTrue(info_.get('photo', 'taken_date_time') in {None, datetime(2001, 6, 9, 15, 17, 32)})
-			self.assertTrue(info_.get('photo', 'iso') in {None})
-			self.assertTrue(info_.get('image', 'width') in {None, 640})
-			self.assertTrue(info_.get('image', 'height') in {None, 480})
+			self.assertEqual(WrongFields(info_, _CANON_IXUS_FIELDS), [])
 			if info_.get('photo', 'camera_make') is not None:
 				break
-			sleep(sleepTime)
 		else:
-			self.fail(f'EXIF metadata not processed in {iterations * sleepTime}s')
+			self.fail(f'EXIF metadata not processed in {timeout}s')
 
 	def test_photo_metadata2(self):
-		with self.fs.open('DSCN0010.jpg', 'wb') as target, open('tests/DSCN0010.jpg', 'rb') as source:
-			target.write(source.read())
+		with open('tests/DSCN0010.jpg', 'rb') as source:
+			self.fs.upload('DSCN0010.jpg', source)
 
 		# sometimes it take a few seconds for the server to process EXIF data
 		# until it's processed, the "photo" section should be missing
-		iterations = 50
-		sleepTime = 5
-		for iteration in range(iterations):
+		timeout = 250
+		for waited in PollWaits(timeout):
+			self.fs.clear_cache('DSCN0010.jpg')
 			info_ = self.fs.getinfo('DSCN0010.jpg')
 
-			self.assertTrue(info_.get('photo', 'camera_make') in {None, 'NIKON'})
-			self.assertTrue(info_.get('photo', 'camera_model') in {None, 'COOLPIX P6000'})
-			self.assertTrue(info_.get('photo', 'exposure_denominator') in {None, 300.0})
-			self.assertTrue(info_.get('photo', 'exposure_numerator') in {None, 4.0})
-			self.assertTrue(info_.get('photo', 'focal_length') in {None, 24.0})
-			self.assertTrue(info_.get('photo', 'f_number') in {None, 5.9})
-			self.assertTrue(info_.get('photo', 'taken_date_time') in {None, datetime(2008, 10, 22, 16, 28, 39)})
-			self.assertTrue(info_.get('photo', 'iso') in {None, 64})
-			self.assertTrue(info_.get('image', 'width') in {None, 640})
-			self.assertTrue(info_.get('image', 'height') in {None, 480})
-			self.assertTrue(info_.get('location', 'latitude') in {None, 43.46744833333334})
-			self.assertTrue(info_.get('location', 'longitude') in {None, 11.885126666663888})
+			self.assertEqual(WrongFields(info_, _DSCN0010_FIELDS), [])
 			if info_.get('photo', 'camera_make') is not None:
 				break
-			warning(f'EXIF metadata not processed in {iteration * sleepTime}s')
-			sleep(sleepTime)
+			warning(f'EXIF metadata not processed in {waited}s')
 		else:
-			self.fail(f'EXIF metadata not processed in {iterations * sleepTime}s')
+			self.fail(f'EXIF metadata not processed in {timeout}s')
 
 	def test_hashes(self):
 		with self.fs.open('DSCN0010.jpg', 'wb') as target, open('tests/DSCN0010.jpg', 'rb') as source:
 			data = source.read()
 			target.write(data)
 
-		hash_ = sha1() # noqa: S324
-		hash_.update(data)
+		hash_ = sha1(data) # noqa: S324
 
 		# It takes time for the server to calculate the hashes
-		iterations = 50
-		sleepTime = 5
-		for iteration in range(iterations):
+		timeout = 250
+		for waited in PollWaits(timeout):
+			self.fs.clear_cache('DSCN0010.jpg')
 			info_ = self.fs.getinfo('DSCN0010.jpg')
 			if info_.get('hashes', 'SHA1') is not None:
 				break
-			warning(f'Hashes not calculated in {iteration * sleepTime}s')
-			sleep(sleepTime)
+			warning(f'Hashes not calculated in {waited}s')
 		else:
-			self.fail(f'Hashes not calculated in {iterations * sleepTime}s')
+			self.fail(f'Hashes not calculated in {timeout}s')
 		self.assertEqual(hash_.hexdigest().upper(), info_.get('hashes', 'SHA1'))
 
+	def test_getinfo_many(self):
+		self.fs.writetext('a.txt', 'a')
+		self.fs.makedir('b')
+		infos = self.fs.getinfo_many(['a.txt', 'b', 'a.txt'], namespaces=['details'])
+		assert [x.name for x in infos] == ['a.txt', 'b', 'a.txt']
+		assert [x.is_dir for x in infos] == [False, True, False]
+		assert infos[0].size == 1
+
+		# a new instance has nothing cached, so all three lookups go in one batch, which reports the missing one
+		with raises(ResourceNotFound):
+			FullFS().opendir(self.testSubdir).getinfo_many(['a.txt', 'b', 'missing.txt'])
+
 	def test_download_as_format(self):
 		with self.fs.open('a.md', 'w') as f:
 			f.write('test')